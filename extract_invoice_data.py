@@ -1,10 +1,13 @@
-import os
-import json
+import sys
+import orjson
+import asyncio
+from functools import lru_cache
+from pathlib import Path
 import re
-from langchain_community.document_loaders import PDFPlumberLoader
-from langchain_ollama import ChatOllama
 from langchain.output_parsers import ResponseSchema
-from langchain.output_parsers import StructuredOutputParser
+import llm_config
+import pdf_text
+import invoice_fields
 
 
 # Define ResponseSchemas for invoice extraction
@@ -89,6 +92,12 @@ items_schema = ResponseSchema(
     description="List of purchased item descriptions - extract only strings BEFORE the pipe | character"
 )
 
+summary_schema = ResponseSchema(
+    name="summary",
+    description="A clear and concise summary of the transaction in simple, plain English. \
+    Write it as a single paragraph without bullet points or sections. Make it easy to understand for anyone."
+)
+
 response_schemas = [
     shipping_address_schema,
     delivery_schema,
@@ -104,82 +113,79 @@ response_schemas = [
     asin_schema,
     sku_schema,
     hsn_schema,
-    items_schema
+    items_schema,
+    summary_schema
 ]
 
-output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
+# Prompts and parsers are built once at import, see invoice_fields.InvoiceExtractor
+extractor = invoice_fields.InvoiceExtractor(response_schemas)
 
 
-def main():
-    # Expand path properly
-    pdf_path = os.path.expanduser("~/Desktop/amazon_invoice/115.pdf")
+# Sample invoice used when no PDFs are given on the command line
+PDF_PATH = Path("~/Desktop/amazon_invoice/115.pdf").expanduser()
+
 
-    if not os.path.exists(pdf_path):
+def load_page_text(pdf_path):
+    if not pdf_path.is_file():
         raise FileNotFoundError(f"PDF not found at: {pdf_path}")
 
-    # Load PDF with PDFPlumberLoader for better table extraction
-    loader = PDFPlumberLoader(pdf_path)
-    documents = loader.load()
+    # Extract only second page
+    return pdf_text.load_page_text(str(pdf_path))
 
-    if len(documents) < 2:
-        raise ValueError("PDF does not contain a second page.")
 
-    # Extract only second page
-    page_text = documents[1].page_content.strip()
+def main():
+    # Invoice PDFs can be passed on the command line, otherwise use the sample invoice
+    pdf_paths = [Path(path).expanduser() for path in sys.argv[1:]] or [PDF_PATH]
 
-    print("\n--- Extracting Invoice Fields ---\n")
+    # A missing or unreadable PDF is reported and skipped, the rest are still extracted
+    loaded = []
+    for pdf_path in pdf_paths:
+        try:
+            loaded.append((pdf_path, load_page_text(pdf_path)))
+        except Exception as e:
+            print(f"⚠️ {pdf_path}: {type(e).__name__}: {e}")
 
-    # Initialize Ollama LLM
-    llm = ChatOllama(
-        model="llama3.1",
-        temperature=0
-    )
+    if not loaded:
+        return
 
-    # Get formatting instructions from the output parser
-    format_instructions = output_parser.get_format_instructions()
+    pdf_paths = [pdf_path for pdf_path, _ in loaded]
+    page_texts = [page_text for _, page_text in loaded]
 
-    # Structured extraction prompt
-    prompt = f"""
-    Extract the following invoice fields from the provided document.
+    print("\n--- Extracting Invoice Fields ---\n")
 
-    {format_instructions}
+    # Initialize Ollama LLMs (keep_alive keeps the models and their prompt cache loaded):
+    # the small model handles every invoice, the larger one is only created
+    # (and loaded) for the ones it fails on
+    fast_llm = llm_config.create_llm(llm_config.FAST_MODEL_NAME, json_mode=True, prefix=extractor.system_prefix)
 
-    Invoice Page:
-    {page_text}
-    """
+    @lru_cache(maxsize=None)
+    def get_fallback_llm():
+        return llm_config.create_llm(llm_config.MODEL_NAME, json_mode=True, prefix=extractor.system_prefix)
 
     print("Prompt sent to LLM:\n")
-    print(prompt)
+    messages = extractor.build_prompt(page_texts[0])
+    for message in messages:
+        print(message.content)
     print("\n---\n")
 
-    response = llm.invoke(prompt)
-
-    try:
-        # Parse structured output
-        parsed = output_parser.parse(response.content)
-        print(json.dumps(parsed, indent=4))
-        
-        # Generate summary based on extracted data
-        print("\n--- Generating Summary ---\n")
-        
-        summary_prompt = f"""
-        Based on the following extracted invoice data, write a clear and concise summary of the transaction in simple, plain English. 
-        Write it as a single paragraph without bullet points or sections. Make it easy to understand for anyone.
-        
-        {json.dumps(parsed, indent=2)}
-        """
-        
-        summary_response = llm.invoke(summary_prompt)
-        
-        print("Invoice Summary:\n")
-        print(summary_response.content)
-        
-    except Exception as e:
-        print(f"⚠️ Could not parse structured output: {e}\n")
-        print("Raw LLM output below:\n")
-        print(response.content)
+    results = asyncio.run(extractor.extract_all(page_texts, fast_llm, get_fallback_llm))
+
+    for pdf_path, result in zip(pdf_paths, results):
+        print(f"\n=== {pdf_path} ===\n")
+
+        if isinstance(result, Exception):
+            print(f"⚠️ Extraction failed with {type(result).__name__}: {result}\n")
+            if getattr(result, "llm_output", None):
+                print("Raw LLM output below:\n")
+                print(result.llm_output)
+            continue
+
+        # The summary is returned alongside the fields
+        print(orjson.dumps(result["extracted_data"], option=orjson.OPT_INDENT_2).decode())
+
+        print("\n--- Invoice Summary ---\n")
+        print(result["summary"])
 
 
 if __name__ == "__main__":
     main()
-
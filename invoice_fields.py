@@ -0,0 +1,138 @@
+import re
+import asyncio
+from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.exceptions import OutputParserException
+import llm_cache
+import llm_config
+from json_parsing import OrjsonStructuredOutputParser
+
+
+# Fields that follow a fixed textual pattern on Amazon invoices. Values the
+# regexes find are copied verbatim from the page, so they replace the ones the
+# LLM generated for these fields.
+# IDs must be whole words containing a digit, so a table header such as
+# "Invoice Number Invoice Date" does not match the start of the next word.
+FIELD_PATTERNS = {
+    "order_number": re.compile(r"\bOrder Number\s*:?\s*(\d{3}-\d{7}-\d{7})\b"),
+    "invoice_number": re.compile(r"\bInvoice Number\s*:?\s*\b(?=[A-Z-]*\d)([A-Z0-9][A-Z0-9-]*)\b"),
+    "asin": re.compile(r"\|\s*\b(?=[A-Z]*\d)([A-Z0-9]{10})\b"),
+    "sku": re.compile(r"\(\s*([A-Z0-9]+(?:-[A-Z0-9]+)+)\s*\)"),
+    "hsn": re.compile(r"\bHSN:\s*(\d+)\b")
+}
+
+
+def extract_fields(page_text):
+    """
+    Return the pattern-based fields found in the page text.
+    Fields that differ between items (ASIN, SKU, HSN) come back as a list.
+    """
+    fields = {}
+    for name, pattern in FIELD_PATTERNS.items():
+        matches = list(dict.fromkeys(pattern.findall(page_text)))
+        if matches:
+            fields[name] = matches[0] if len(matches) == 1 else matches
+    return fields
+
+
+def merge_fields(parsed, fields, response_schemas):
+    """
+    Merge regex fields into the LLM output, keeping the schema field order.
+    A field the regexes found overrides the LLM's answer; the LLM's answer is
+    kept for the fields they did not find.
+    """
+    merged = {**parsed, **fields}
+    return {schema.name: merged[schema.name] for schema in response_schemas if schema.name in merged}
+
+
+def _system_prefix(response_schemas):
+    # The clients decode in JSON mode, so ask for a plain JSON object; the
+    # parser's format instructions ask for a ```json fence, which conflicts
+    # with the JSON grammar and can make the model pad the output with whitespace
+    keys = "\n".join(
+        f'\t"{schema.name}": {schema.type}  // {schema.description}'
+        for schema in response_schemas
+    )
+    return f"""Extract the following invoice fields from the provided document.
+
+Respond with a JSON object with these keys:
+
+{{
+{keys}
+}}
+"""
+
+
+class InvoiceExtractor:
+    """
+    Extracts the given response schemas from invoice pages. The prompt is
+    built once, so the static prefix is identical on every request and Ollama
+    can reuse its cached prefix; only the invoice text, sent last, changes.
+    """
+
+    def __init__(self, response_schemas):
+        self.response_schemas = response_schemas
+        self.output_parser = OrjsonStructuredOutputParser.from_response_schemas(response_schemas)
+        self.system_prefix = _system_prefix(response_schemas)
+
+    def build_prompt(self, page_text):
+        """Return the messages to send for a page"""
+        return [
+            SystemMessage(content=self.system_prefix),
+            HumanMessage(content=f"Invoice Page:\n{page_text}")
+        ]
+
+    async def extract(self, page_text, fast_llm, load_fallback_llm, on_token=None):
+        """
+        Extract one invoice page with fast_llm, retrying with the client returned
+        by `await load_fallback_llm()` if the output cannot be parsed; the
+        fallback client (and its model) is only created when needed. Returns
+        the summary and the extracted fields.
+        """
+        messages = self.build_prompt(page_text)
+
+        response_text = await llm_cache.cached_ainvoke(fast_llm, messages, on_token)
+        try:
+            llm_parsed = self.output_parser.parse(response_text)
+        except OutputParserException:
+            # The small model's output was unusable; retry with the larger model
+            fallback_llm = await load_fallback_llm()
+            response_text = await llm_cache.cached_ainvoke(fallback_llm, messages, on_token)
+            try:
+                llm_parsed = self.output_parser.parse(response_text)
+            except OutputParserException as e:
+                raise OutputParserException(str(e), llm_output=response_text)
+
+        parsed = merge_fields(llm_parsed, extract_fields(page_text), self.response_schemas)
+        return {
+            "summary": parsed.pop("summary"),
+            "extracted_data": parsed
+        }
+
+    async def extract_all(self, page_texts, fast_llm, get_fallback_llm, on_token=None):
+        """
+        Extract several pages concurrently, at most MAX_CONCURRENT_REQUESTS at a
+        time. Failed pages come back as the exception raised for them; on_token,
+        if given, is called with the page index and its token count so far.
+        get_fallback_llm should return the same client on every call.
+        """
+        semaphore = asyncio.Semaphore(llm_config.MAX_CONCURRENT_REQUESTS)
+        fallback_lock = asyncio.Lock()
+
+        async def load_fallback_llm():
+            # Creating the client measures the prefix with a blocking Ollama
+            # call that loads the model; run it in a thread so the other pages
+            # keep streaming, and one page at a time so it is only created once
+            async with fallback_lock:
+                return await asyncio.to_thread(get_fallback_llm)
+
+        async def extract_one(index, page_text):
+            page_on_token = None
+            if on_token is not None:
+                page_on_token = lambda count: on_token(index, count)
+            async with semaphore:
+                return await self.extract(page_text, fast_llm, load_fallback_llm, page_on_token)
+
+        return await asyncio.gather(
+            *[extract_one(index, page_text) for index, page_text in enumerate(page_texts)],
+            return_exceptions=True
+        )
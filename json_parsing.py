@@ -0,0 +1,28 @@
+import orjson
+from langchain.output_parsers import StructuredOutputParser
+from langchain_core.exceptions import OutputParserException
+
+
+class OrjsonStructuredOutputParser(StructuredOutputParser):
+    """
+    StructuredOutputParser that parses the LLM output with orjson.
+    Meant for clients in JSON mode, whose output is plain JSON without code
+    fences; falls back to the default (more lenient) parser otherwise.
+    """
+
+    def parse(self, text: str):
+        try:
+            parsed = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            return super().parse(text)
+
+        if not isinstance(parsed, dict):
+            return super().parse(text)
+
+        for schema in self.response_schemas:
+            if schema.name not in parsed:
+                raise OutputParserException(
+                    f"Got invalid return object. Expected key `{schema.name}` "
+                    f"to be present, but got {parsed}"
+                )
+        return parsed
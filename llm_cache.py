@@ -0,0 +1,67 @@
+from pathlib import Path
+import hashlib
+from diskcache import Cache
+import llm_config
+
+
+# Bump this when the prompts or response schemas change so old entries are ignored
+SCHEMA_VERSION = "3"
+
+CACHE_DIR = Path("~/.cache/invoice_llm").expanduser()
+
+_cache = Cache(str(CACHE_DIR))
+
+
+def make_key(llm, messages):
+    """
+    Build a SHA-256 cache key from the schema version, the model and the client
+    options that change the output, and the prompt text
+    """
+    # Including num_ctx / num_predict means raising them (e.g. INVOICE_NUM_CTX=4096
+    # after a truncated response) asks the model again instead of hitting the cache
+    parts = [SCHEMA_VERSION, llm.model, str(llm.format), str(llm.num_ctx), str(llm.num_predict)]
+    for message in messages:
+        # Normalize whitespace so cosmetic differences in extracted text still hit
+        parts.append(" ".join(message.content.split()))
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def get(key):
+    """Return the cached LLM output for key, or None on a miss"""
+    return _cache.get(key)
+
+
+def set(key, value):
+    """Store the LLM output for key"""
+    _cache.set(key, value)
+
+
+async def _astream_text(llm, messages, on_token):
+    # Stream the response so callers can show progress while the model decodes
+    parts = []
+    async for chunk in llm.astream(messages):
+        parts.append(chunk.content)
+        if on_token is not None:
+            on_token(len(parts))
+    return "".join(parts)
+
+
+async def cached_ainvoke(llm, messages, on_token=None):
+    """
+    Invoke the LLM and return the response text, reusing a previous response
+    for the same prompt. Only deterministic (temperature 0) calls are cached.
+    The response is streamed; on_token, if given, is called with the number
+    of tokens received so far.
+    """
+    llm_config.warn_if_truncated(llm, messages)
+
+    # Ollama samples with a non-zero temperature when none is set
+    if llm.temperature is None or llm.temperature > 0:
+        return await _astream_text(llm, messages, on_token)
+
+    key = make_key(llm, messages)
+    cached = get(key)
+    if cached is None:
+        cached = await _astream_text(llm, messages, on_token)
+        set(key, cached)
+    return cached
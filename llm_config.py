@@ -0,0 +1,120 @@
+import os
+import warnings
+from functools import lru_cache
+from typing import Optional
+import ollama
+from langchain_ollama import ChatOllama
+
+
+# Field extraction is an easy task, so a 4-bit quantized model is used; it
+# needs about half the memory bandwidth of the fp16 default with the same accuracy
+MODEL_NAME = os.environ.get("INVOICE_MODEL", "llama3.1:8b-instruct-q4_K_M")
+
+# Smaller model tried first for structured extraction; if its output cannot
+# be parsed the extraction is retried with MODEL_NAME
+FAST_MODEL_NAME = os.environ.get("INVOICE_FAST_MODEL", "llama3.2:3b-instruct-q4_K_M")
+
+# Invoice pages are ~500 tokens, so a small context keeps the KV cache (and
+# VRAM / RAM use) small. The prompt plus the generated tokens must fit in it:
+# for invoices longer than ~1000 tokens set INVOICE_NUM_CTX=4096, otherwise
+# Ollama truncates the start of the prompt.
+NUM_CTX = int(os.environ.get("INVOICE_NUM_CTX", "1536"))
+
+# Hard cap on generated tokens so a runaway decode stops early. One response
+# carries every field, the item lists and the summary paragraph, so it is
+# sized for all of them; a response cut off at the cap is invalid JSON.
+NUM_PREDICT = 768
+
+NUM_THREAD = os.cpu_count()
+
+# Number of invoices sent to Ollama at the same time. The Ollama server only
+# processes them in parallel when started with OLLAMA_NUM_PARALLEL >= this value.
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+
+
+# Context left for the invoice text (~768 tokens) and the response after the pinned prefix
+SUFFIX_NUM_CTX = 768 + NUM_PREDICT
+
+
+class PinnedPrefixChatOllama(ChatOllama):
+    """
+    ChatOllama that also sends num_keep, so llama.cpp keeps the first num_keep
+    tokens (the static prompt prefix) in the KV cache when the context fills up.
+    """
+
+    num_keep: Optional[int] = None
+
+    @property
+    def _default_params(self):
+        params = super()._default_params
+        params["options"]["num_keep"] = self.num_keep
+        return params
+
+
+def create_llm(model_name=MODEL_NAME, temperature=0, json_mode=False, prefix=None,
+               num_ctx=NUM_CTX, num_predict=NUM_PREDICT):
+    """
+    Return a ChatOllama client with the shared context and decoding limits.
+    With json_mode, Ollama constrains decoding so the output is always valid JSON.
+    With prefix, the static prompt prefix is measured once and pinned with num_keep.
+    Pass num_ctx / num_predict as None to keep Ollama's defaults.
+    """
+    extra = {"format": "json"} if json_mode else {}
+    if prefix is not None:
+        # Size the context from the estimate so the token count below loads
+        # the model with the same num_ctx as the chat calls (no reload)
+        num_ctx = max(num_ctx or NUM_CTX, estimate_tokens(prefix) + SUFFIX_NUM_CTX)
+        prefix_tokens = count_tokens(model_name, prefix, num_ctx)
+        print(f"Static prompt prefix for {model_name}: {prefix_tokens} tokens (num_keep)")
+        extra["num_keep"] = prefix_tokens
+        # The estimate can undercount; the prompt must still fit, even if the
+        # model then has to be reloaded with the larger context
+        num_ctx = max(num_ctx, prefix_tokens + SUFFIX_NUM_CTX)
+
+    return PinnedPrefixChatOllama(
+        model=model_name,
+        temperature=temperature,
+        num_ctx=num_ctx,
+        num_predict=num_predict,
+        num_thread=NUM_THREAD,
+        keep_alive="30m",
+        **extra
+    )
+
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English text
+    return len(text) // 4
+
+
+@lru_cache(maxsize=None)
+def count_tokens(model_name, text, num_ctx=None):
+    """
+    Return the number of tokens the model's tokenizer produces for text, as
+    reported by Ollama; falls back to estimate_tokens if Ollama is unreachable.
+    Pass the num_ctx the model will be used with, so Ollama does not have to
+    reload it for the first chat call.
+    """
+    try:
+        response = ollama.embed(
+            model=model_name,
+            input=text,
+            options={"num_ctx": num_ctx, "num_thread": NUM_THREAD},
+            keep_alive="30m"
+        )
+        return response["prompt_eval_count"]
+    except Exception:
+        return estimate_tokens(text)
+
+
+def warn_if_truncated(llm, messages):
+    """Warn when the prompt plus the response may not fit in the context window"""
+    if llm.num_ctx is None:
+        return
+
+    prompt_tokens = sum(estimate_tokens(message.content) for message in messages)
+    if prompt_tokens + (llm.num_predict or 0) > llm.num_ctx:
+        warnings.warn(
+            f"Prompt is ~{prompt_tokens} tokens and may not fit in num_ctx={llm.num_ctx}; "
+            f"set INVOICE_NUM_CTX=4096 if the output looks incomplete."
+        )
@@ -1,34 +1,29 @@
-import os
-import re
-from langchain_community.document_loaders import PDFPlumberLoader
-from langchain_ollama import ChatOllama
+from pathlib import Path
+import pdf_text
+import llm_config
 
-def main():
-    pdf_path = os.path.expanduser("~/Desktop/amazon_invoice/118.pdf")
-
-    loader = PDFPlumberLoader(pdf_path)
-    documents = loader.load()
-
-    if len(documents) < 2:
-        raise ValueError("PDF does not contain a second page.")
+PDF_PATH = Path("~/Desktop/amazon_invoice/118.pdf").expanduser()
 
+def main():
     # Extract second page
-    text = documents[1].page_content
+    text = pdf_text.load_page_text(str(PDF_PATH))
 
-    # Clean formatting
-    text = re.sub(r'\n+', '\n', text)        # remove excessive newlines
-    text = re.sub(r'[ \t]+', ' ', text)      # remove extra spaces
-    text = text.strip()
+    # Clean formatting in one pass: collapse runs of spaces within each line
+    # and drop empty lines
+    text = "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
 
-    # LLM call
-    llm = ChatOllama(model="llama3.1")
-
-    response = llm.invoke(
-        f"Format the following invoice page into a clean readable structure:\n\n{text}"
-    )
+    # LLM call; reformatting the whole page is free-form and can run long, so
+    # it keeps Ollama's default context size and output length
+    llm = llm_config.create_llm(temperature=None, num_ctx=None, num_predict=None)
 
     print("LLM Summary:\n")
-    print(response.content)
+
+    # Stream tokens to the terminal as they are generated
+    for chunk in llm.stream(
+        f"Format the following invoice page into a clean readable structure:\n\n{text}"
+    ):
+        print(chunk.content, end="", flush=True)
+    print()
 
 if __name__ == "__main__":
     main()
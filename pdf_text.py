@@ -0,0 +1,44 @@
+import re
+import pypdfium2 as pdfium
+import pdfplumber
+
+
+# "pdfium" parses text an order of magnitude faster than pdfplumber;
+# "pdfplumber" is slower but keeps table layout intact
+PDF_BACKEND = "pdfium"
+
+# Item rows always carry an HSN code; if the fast backend lost it, the table
+# text came out mangled and we re-read the page with pdfplumber
+HSN_RE = re.compile(r"HSN:\s*\d+")
+
+
+def _pdfium_page_text(pdf_path, page_index):
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        if len(pdf) <= page_index:
+            raise ValueError(f"PDF does not contain page {page_index + 1}.")
+        textpage = pdf[page_index].get_textpage()
+        return textpage.get_text_range().replace("\r\n", "\n")
+    finally:
+        pdf.close()
+
+
+def _pdfplumber_page_text(pdf_path, page_index):
+    # Only parse the page we need instead of loading the whole document
+    try:
+        with pdfplumber.open(pdf_path, pages=[page_index + 1]) as pdf:
+            return pdf.pages[0].extract_text() or ""
+    except IndexError:
+        raise ValueError(f"PDF does not contain page {page_index + 1}.")
+
+
+def load_page_text(pdf_path, page_index=1):
+    """
+    Return the text of a single PDF page (the second page by default).
+    """
+    if PDF_BACKEND == "pdfium":
+        text = _pdfium_page_text(pdf_path, page_index)
+        if HSN_RE.search(text):
+            return text.strip()
+
+    return _pdfplumber_page_text(pdf_path, page_index).strip()
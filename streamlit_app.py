@@ -1,12 +1,17 @@
 import streamlit as st
-import os
-import json
+import pandas as pd
+import csv
+import io
+import asyncio
+import orjson
+import shutil
 import tempfile
+from pathlib import Path
 import time
-from langchain_community.document_loaders import PDFPlumberLoader
-from langchain_ollama import ChatOllama
 from langchain.output_parsers import ResponseSchema
-from langchain.output_parsers import StructuredOutputParser
+import llm_config
+import pdf_text
+import invoice_fields
 
 
 # Page configuration
@@ -45,159 +50,167 @@ st.markdown("""
 
 
 # Define ResponseSchemas for invoice extraction
-def get_response_schemas():
-    return [
-        ResponseSchema(
-            name="shipping_address",
-            description="Shipping address details including Name, Address, and State Code"
-        ),
-        ResponseSchema(
-            name="place_of_delivery",
-            description="Place of delivery for the order"
-        ),
-        ResponseSchema(
-            name="reverse_charge",
-            description="Reverse charge applicable (Yes/No)"
-        ),
-        ResponseSchema(
-            name="payment_transaction_id",
-            description="Payment transaction ID"
-        ),
-        ResponseSchema(
-            name="payment_datetime",
-            description="Date and time of payment"
-        ),
-        ResponseSchema(
-            name="payment_mode",
-            description="Mode of payment used"
-        ),
-        ResponseSchema(
-            name="total_amount",
-            description="Total amount charged"
-        ),
-        ResponseSchema(
-            name="order_number",
-            description="Order number from the invoice"
-        ),
-        ResponseSchema(
-            name="invoice_number",
-            description="Invoice number"
-        ),
-        ResponseSchema(
-            name="order_date",
-            description="Order date"
-        ),
-        ResponseSchema(
-            name="quantity",
-            description="Qty"
-        ),
-        ResponseSchema(
-            name="asin",
-            description="ASIN (Amazon Standard Identification Number) - Extract the 10-character alphanumeric code that appears after the last pipe | character. Example: B0FZTX33DW"
-        ),
-        ResponseSchema(
-            name="sku",
-            description="SKU (Stock Keeping Unit) - Extract the alphanumeric code that appears inside parentheses ( ) after the ASIN. Example: NM-8PYA-4Y4G"
-        ),
-        ResponseSchema(
-            name="hsn",
-            description="HSN (Harmonized System of Nomenclature) code - Extract the numeric code that appears after 'HSN:' in the item details. Example: 10063010"
-        ),
-        ResponseSchema(
-            name="items",
-            description="List of purchased item descriptions - extract only strings BEFORE the pipe | character"
-        )
-    ]
+RESPONSE_SCHEMAS = [
+    ResponseSchema(
+        name="shipping_address",
+        description="Shipping address details including Name, Address, and State Code"
+    ),
+    ResponseSchema(
+        name="place_of_delivery",
+        description="Place of delivery for the order"
+    ),
+    ResponseSchema(
+        name="reverse_charge",
+        description="Reverse charge applicable (Yes/No)"
+    ),
+    ResponseSchema(
+        name="payment_transaction_id",
+        description="Payment transaction ID"
+    ),
+    ResponseSchema(
+        name="payment_datetime",
+        description="Date and time of payment"
+    ),
+    ResponseSchema(
+        name="payment_mode",
+        description="Mode of payment used"
+    ),
+    ResponseSchema(
+        name="total_amount",
+        description="Total amount charged"
+    ),
+    ResponseSchema(
+        name="order_number",
+        description="Order number from the invoice"
+    ),
+    ResponseSchema(
+        name="invoice_number",
+        description="Invoice number"
+    ),
+    ResponseSchema(
+        name="order_date",
+        description="Order date"
+    ),
+    ResponseSchema(
+        name="quantity",
+        description="Qty"
+    ),
+    ResponseSchema(
+        name="asin",
+        description="ASIN (Amazon Standard Identification Number) - Extract the 10-character alphanumeric code that appears after the last pipe | character. Example: B0FZTX33DW"
+    ),
+    ResponseSchema(
+        name="sku",
+        description="SKU (Stock Keeping Unit) - Extract the alphanumeric code that appears inside parentheses ( ) after the ASIN. Example: NM-8PYA-4Y4G"
+    ),
+    ResponseSchema(
+        name="hsn",
+        description="HSN (Harmonized System of Nomenclature) code - Extract the numeric code that appears after 'HSN:' in the item details. Example: 10063010"
+    ),
+    ResponseSchema(
+        name="items",
+        description="List of purchased item descriptions - extract only strings BEFORE the pipe | character"
+    ),
+    ResponseSchema(
+        name="summary",
+        description="A clear and concise summary of the transaction in simple, plain English. Write it as a single paragraph without bullet points or sections. Make it easy to understand for anyone."
+    )
+]
+
+# Prompts and parsers are built once at import so the prompt prefix is
+# identical on every request, see invoice_fields.InvoiceExtractor
+EXTRACTOR = invoice_fields.InvoiceExtractor(RESPONSE_SCHEMAS)
+
+
+# Number of streamed tokens between redraws of the progress display
+PROGRESS_TOKEN_STEP = 20
+
 
+# No spinner: the fallback client is created from a worker thread during
+# extraction, where Streamlit elements cannot be drawn
+@st.cache_resource(show_spinner=False)
+def get_llm(model_name):
+    """Return a ChatOllama client shared across Streamlit reruns and sessions"""
+    return llm_config.create_llm(model_name, json_mode=True, prefix=EXTRACTOR.system_prefix)
 
-def extract_invoice_data(pdf_path):
-    """Extract invoice data from PDF"""
+
+def extract_invoice_data(pdf_files):
+    """Extract invoice data from a list of (file name, PDF path) pairs"""
     
-    # Step 1: Load PDF
     status_placeholder = st.empty()
     progress_placeholder = st.empty()
     
     extraction_steps = [
-        "📂 Loading PDF file...",
-        "📄 Extracting text from invoice...",
+        "📄 Loading PDF files and extracting text...",
         "🔍 Sending to AI for processing...",
-        "⚙️ Parsing structured data...",
-        "✍️ Generating summary...",
+        "⚙️ Parsing structured data and summary...",
         "✅ Extraction complete!"
     ]
     
+    results = []
+    
     try:
-        # Step 1: Load PDF
+        # Step 1: Load PDFs and extract text
         with status_placeholder.container():
             st.info(extraction_steps[0])
-        time.sleep(0.5)
         
-        loader = PDFPlumberLoader(pdf_path)
-        documents = loader.load()
+        loaded = []
+        for file_name, pdf_path in pdf_files:
+            try:
+                loaded.append((file_name, pdf_text.load_page_text(pdf_path)))
+            except Exception as e:
+                st.error(f"❌ {file_name}: {str(e)}")
         
-        if len(documents) < 2:
-            st.error("❌ PDF does not contain a second page.")
+        if not loaded:
             return None
         
-        # Step 2: Extract text
+        # Step 2: Initialize LLMs
         with status_placeholder.container():
             st.info(extraction_steps[1])
-        time.sleep(0.5)
         
-        page_text = documents[1].page_content.strip()
+        # The larger model is only created (and loaded) if the small one fails
+        fast_llm = get_llm(llm_config.FAST_MODEL_NAME)
+        def get_fallback_llm():
+            return get_llm(llm_config.MODEL_NAME)
         
-        # Step 3: Initialize LLM and prepare schemas
+        # Step 3: Send all invoices at once and parse each structured output
+        # (summary comes back in the same response)
         with status_placeholder.container():
             st.info(extraction_steps[2])
-        time.sleep(0.5)
-        
-        llm = ChatOllama(model="llama3.1", temperature=0)
-        response_schemas = get_response_schemas()
-        output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
-        
-        format_instructions = output_parser.get_format_instructions()
         
-        prompt = f"""
-        Extract the following invoice fields from the provided document.
+        # Show live token counts while the responses stream in, redrawing only
+        # every PROGRESS_TOKEN_STEP tokens per invoice
+        token_counts = [0] * len(loaded)
 
-        {format_instructions}
-
-        Invoice Page:
-        {page_text}
-        """
-        
-        response = llm.invoke(prompt)
-        
-        # Step 4: Parse structured output
-        with status_placeholder.container():
-            st.info(extraction_steps[3])
-        time.sleep(0.5)
-        
-        parsed = output_parser.parse(response.content)
-        
-        # Step 5: Generate summary
-        with status_placeholder.container():
-            st.info(extraction_steps[4])
-        time.sleep(0.5)
-        
-        summary_prompt = f"""
-        Based on the following extracted invoice data, write a clear and concise summary of the transaction in simple, plain English. 
-        Write it as a single paragraph without bullet points or sections. Make it easy to understand for anyone.
-        
-        {json.dumps(parsed, indent=2)}
-        """
+        def show_progress(index, count):
+            # A lower count means the larger model restarted the response
+            # after the small one failed; start counting again from there
+            if count >= token_counts[index] and count - token_counts[index] < PROGRESS_TOKEN_STEP:
+                return
+            token_counts[index] = count
+            progress_placeholder.markdown("\n".join(
+                f"- {file_name}: {tokens} tokens received"
+                for (file_name, _), tokens in zip(loaded, token_counts)
+            ))
+        
+        outcomes = asyncio.run(
+            EXTRACTOR.extract_all(
+                [page_text for _, page_text in loaded], fast_llm, get_fallback_llm, show_progress
+            )
+        )
+        progress_placeholder.empty()
         
-        summary_response = llm.invoke(summary_prompt)
+        for (file_name, _), outcome in zip(loaded, outcomes):
+            if isinstance(outcome, Exception):
+                st.error(f"❌ Error during extraction of {file_name}: {str(outcome)}")
+            else:
+                results.append({"file_name": file_name, **outcome})
         
-        # Step 6: Complete
+        # Step 4: Complete
         with status_placeholder.container():
-            st.success(extraction_steps[5])
-        time.sleep(0.5)
+            st.success(extraction_steps[3])
         
-        return {
-            "extracted_data": parsed,
-            "summary": summary_response.content
-        }
+        return results or None
         
     except Exception as e:
         st.error(f"❌ Error during extraction: {str(e)}")
@@ -249,28 +262,37 @@ col1, col2 = st.columns([1, 1])
 with col1:
     st.subheader("📤 Upload Invoice")
     
-    uploaded_file = st.file_uploader("Choose a PDF invoice", type="pdf", key="pdf_uploader")
+    uploaded_files = st.file_uploader(
+        "Choose PDF invoices",
+        type="pdf",
+        accept_multiple_files=True,
+        key="pdf_uploader"
+    )
     
-    if uploaded_file is not None:
-        st.success(f"✅ File uploaded: {uploaded_file.name}")
+    if uploaded_files:
+        st.success(f"✅ Files uploaded: {', '.join(f.name for f in uploaded_files)}")
         
         if st.button("🚀 Extract Invoice Data", use_container_width=True, type="primary"):
-            # Save uploaded file to temp location
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(uploaded_file.getbuffer())
-                temp_pdf_path = tmp_file.name
-            
+            pdf_files = []
             try:
+                # Save uploaded files to temp locations
+                for uploaded_file in uploaded_files:
+                    uploaded_file.seek(0)
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+                        pdf_files.append((uploaded_file.name, tmp_file.name))
+                        # Copy in 64 KB chunks instead of writing the whole buffer at once
+                        shutil.copyfileobj(uploaded_file, tmp_file, length=64 * 1024)
+                
                 with st.spinner("Processing..."):
-                    result = extract_invoice_data(temp_pdf_path)
+                    results = extract_invoice_data(pdf_files)
                 
-                if result:
-                    st.session_state.extraction_result = result
+                if results:
+                    st.session_state.extraction_results = results
                     st.rerun()
             finally:
-                # Clean up temp file
-                if os.path.exists(temp_pdf_path):
-                    os.remove(temp_pdf_path)
+                # Clean up temp files
+                for _, temp_pdf_path in pdf_files:
+                    Path(temp_pdf_path).unlink(missing_ok=True)
     else:
         st.info("👆 Upload a PDF invoice to get started")
 
@@ -278,7 +300,7 @@ with col1:
 with col2:
     st.subheader("📋 Instructions")
     st.markdown("""
-    1. **Click on "Browse files"** to select your invoice PDF
+    1. **Click on "Browse files"** to select one or more invoice PDFs
     2. **Wait for the upload** to complete
     3. **Click "Extract Invoice Data"** button
     4. **Watch the progress** as the AI extracts information
@@ -288,105 +310,102 @@ with col2:
 
 
 # Display results if available
-if "extraction_result" in st.session_state:
-    result = st.session_state.extraction_result
-    
-    st.divider()
+if st.session_state.get("extraction_results"):
+    for index, result in enumerate(st.session_state.extraction_results):
+        st.divider()
+        st.header(f"📄 {result['file_name']}")
+        
+        # Tabs for different views
+        tab1, tab2, tab3 = st.tabs(["📝 Summary", "📊 Extracted Data", "💾 Download"])
     
-    # Tabs for different views
-    tab1, tab2, tab3 = st.tabs(["📝 Summary", "📊 Extracted Data", "💾 Download"])
+        with tab1:
+            st.subheader("Invoice Summary")
+            st.markdown(f"""
+            <div class='status-box success-box'>
+            {result['summary']}
+            </div>
+            """, unsafe_allow_html=True)
     
-    with tab1:
-        st.subheader("Invoice Summary")
-        st.markdown(f"""
-        <div class='status-box success-box'>
-        {result['summary']}
-        </div>
-        """, unsafe_allow_html=True)
+        with tab2:
+            st.subheader("Extracted Data (JSON Format)")
+        
+            extracted_data = result['extracted_data']
+        
+            # Convert extracted data to DataFrame for tabular display
+            # Create a list of dictionaries for the dataframe
+            data_for_table = [
+                {
+                    "Field": key.replace('_', ' ').title(),
+                    "Value": str(value)
+                }
+                for key, value in extracted_data.items()
+            ]
+        
+            # Create and display dataframe
+            df = pd.DataFrame(data_for_table)
+        
+            st.dataframe(
+                df,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Field": st.column_config.TextColumn(
+                        "Field",
+                        width="medium"
+                    ),
+                    "Value": st.column_config.TextColumn(
+                        "Value",
+                        width="large"
+                    )
+                }
+            )
+        
+            # Also show raw JSON
+            with st.expander("📄 View Raw JSON"):
+                st.json(extracted_data)
     
-    with tab2:
-        st.subheader("Extracted Data (JSON Format)")
-        
-        extracted_data = result['extracted_data']
-        
-        # Convert extracted data to DataFrame for tabular display
-        import pandas as pd
-        
-        # Create a list of dictionaries for the dataframe
-        data_for_table = [
-            {
-                "Field": key.replace('_', ' ').title(),
-                "Value": str(value)
+        with tab3:
+            st.subheader("💾 Download Results")
+        
+            # Prepare download data
+            download_data = {
+                "extracted_fields": result['extracted_data'],
+                "summary": result['summary'],
+                "extraction_timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            for key, value in extracted_data.items()
-        ]
-        
-        # Create and display dataframe
-        df = pd.DataFrame(data_for_table)
-        
-        st.dataframe(
-            df,
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                "Field": st.column_config.TextColumn(
-                    "Field",
-                    width="medium"
-                ),
-                "Value": st.column_config.TextColumn(
-                    "Value",
-                    width="large"
-                )
-            }
-        )
         
-        # Also show raw JSON
-        with st.expander("📄 View Raw JSON"):
-            st.json(extracted_data)
-    
-    with tab3:
-        st.subheader("💾 Download Results")
-        
-        # Prepare download data
-        download_data = {
-            "extracted_fields": result['extracted_data'],
-            "summary": result['summary'],
-            "extraction_timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        json_str = json.dumps(download_data, indent=2)
-        
-        st.download_button(
-            label="📥 Download as JSON",
-            data=json_str,
-            file_name="invoice_extraction.json",
-            mime="application/json",
-            use_container_width=True
-        )
-        
-        # Also offer CSV format for just the fields
-        import csv
-        import io
-        
-        csv_buffer = io.StringIO()
-        writer = csv.writer(csv_buffer)
-        writer.writerow(["Field", "Value"])
-        for key, value in result['extracted_data'].items():
-            writer.writerow([key, value])
-        
-        csv_str = csv_buffer.getvalue()
-        
-        st.download_button(
-            label="📥 Download as CSV",
-            data=csv_str,
-            file_name="invoice_extraction.csv",
-            mime="text/csv",
-            use_container_width=True
-        )
+            json_str = orjson.dumps(download_data, option=orjson.OPT_INDENT_2).decode()
+        
+            st.download_button(
+                label="📥 Download as JSON",
+                data=json_str,
+                file_name=f"{Path(result['file_name']).stem}_extraction.json",
+                mime="application/json",
+                use_container_width=True,
+                key=f"download_json_{index}"
+            )
+        
+            # Also offer CSV format for just the fields
+            csv_buffer = io.StringIO()
+            writer = csv.writer(csv_buffer)
+            writer.writerow(["Field", "Value"])
+            for key, value in result['extracted_data'].items():
+                writer.writerow([key, value])
+        
+            csv_str = csv_buffer.getvalue()
+        
+            st.download_button(
+                label="📥 Download as CSV",
+                data=csv_str,
+                file_name=f"{Path(result['file_name']).stem}_extraction.csv",
+                mime="text/csv",
+                use_container_width=True,
+                key=f"download_csv_{index}"
+            )
     
     # Reset button
     if st.button("🔄 Clear Results & Start Over", use_container_width=True):
-        st.session_state.extraction_result = None
+        st.session_state.extraction_results = None
         st.rerun()
 
 
@@ -394,7 +413,7 @@ if "extraction_result" in st.session_state:
 st.divider()
 st.markdown("""
     <div style='text-align: center; color: #888; margin-top: 2rem;'>
-    <p>🤖 Powered by LLaMA 3.1 AI • Built with Streamlit</p>
+    <p>🤖 Powered by LLaMA AI • Built with Streamlit</p>
     <p><small>Upload your invoices securely. Data is processed locally and not stored.</small></p>
     </div>
 """, unsafe_allow_html=True)
@@ -1,87 +1,73 @@
-import os
-import json
-import re
-import csv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_ollama import ChatOllama
-
-
-def clean_llm_json(raw_output: str):
-    """
-    Cleans LLM response if wrapped in markdown or extra text.
-    """
-    cleaned = re.sub(r"```json|```", "", raw_output).strip()
-    match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-    if match:
-        return match.group(0)
-    return cleaned
+from pathlib import Path
+import orjson
+import pandas as pd
+from langchain_core.messages import SystemMessage, HumanMessage
+import pdf_text
+import llm_config
+
+
+PDF_PATH = Path("~/Desktop/amazon_invoice/118.pdf").expanduser()
+
+# Static prompt prefix, sent first so Ollama can reuse the cached prefix;
+# the invoice text is sent last as the only part that changes between calls.
+SYSTEM_PREFIX = """Extract the following invoice fields.
+
+Return ONLY valid JSON with this exact structure:
+
+{
+    "Shipping Address": {
+        "Name": "",
+        "Address": "",
+        "State Code": ""
+    },
+    "Place of delivery": "",
+    "Payment Details": {
+        "Reverse Charge": "",
+        "Payment Transaction ID": "",
+        "Date & Time": "",
+        "Mode of Payment": ""
+    },
+    "Total Amount": "",
+    "Order and Invoice Information": {
+        "Order Number": "",
+        "Invoice Number": "",
+        "Order Date": "",
+        "Invoice Date": "",
+        "Invoice ID": ""
+    },
+    "Items": [
+        {
+            "Description": "",
+            "Unit Price": "",
+            "Quantity": ""
+        }
+    ]
+}
+"""
 
 
 def main():
-    pdf_path = os.path.expanduser("~/Desktop/amazon_invoice/118.pdf")
     output_csv = "invoice_output.csv"
 
-    if not os.path.exists(pdf_path):
-        raise FileNotFoundError(f"PDF not found at: {pdf_path}")
-
-    # Load PDF
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
-
-    if len(documents) < 2:
-        raise ValueError("PDF does not contain a second page.")
-
-    page_text = documents[1].page_content.strip()
-
-    # Initialize Ollama
-    llm = ChatOllama(model="llama3.1", temperature=0)
-
-    prompt = f"""
-    Extract the following invoice fields.
-
-    Return ONLY valid JSON with this exact structure:
-
-    {{
-        "Shipping Address": {{
-            "Name": "",
-            "Address": "",
-            "State Code": ""
-        }},
-        "Place of delivery": "",
-        "Payment Details": {{
-            "Reverse Charge": "",
-            "Payment Transaction ID": "",
-            "Date & Time": "",
-            "Mode of Payment": ""
-        }},
-        "Total Amount": "",
-        "Order and Invoice Information": {{
-            "Order Number": "",
-            "Invoice Number": "",
-            "Order Date": "",
-            "Invoice Date": "",
-            "Invoice ID": ""
-        }},
-        "Items": [
-            {{
-                "Description": "",
-                "Unit Price": "",
-                "Quantity": ""
-            }}
-        ]
-    }}
-
-    Invoice Page:
-    {page_text}
-    """
-
-    response = llm.invoke(prompt)
-
-    cleaned_json = clean_llm_json(response.content)
+    if not PDF_PATH.is_file():
+        raise FileNotFoundError(f"PDF not found at: {PDF_PATH}")
+
+    # Load only the second page
+    page_text = pdf_text.load_page_text(str(PDF_PATH))
+
+    # Initialize Ollama in JSON mode so the response is always valid JSON
+    llm = llm_config.create_llm(json_mode=True, prefix=SYSTEM_PREFIX)
+
+    messages = [
+        SystemMessage(content=SYSTEM_PREFIX),
+        HumanMessage(content=f"Invoice Page:\n{page_text}")
+    ]
+
+    response = llm.invoke(messages)
 
     try:
-        data = json.loads(cleaned_json)
-    except json.JSONDecodeError:
+        data = orjson.loads(response.content)
+    except orjson.JSONDecodeError:
         print("⚠️ Failed to parse JSON. Raw output:\n")
         print(response.content)
         return
@@ -104,19 +90,10 @@ def main():
         "Invoice ID": data["Order and Invoice Information"]["Invoice ID"]
     }
 
-    # Write items separately (one row per item)
-    with open(output_csv, mode="w", newline="", encoding="utf-8") as file:
-        fieldnames = list(row.keys()) + ["Description", "Unit Price", "Quantity"]
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-
-        writer.writeheader()
-
-        for item in data["Items"]:
-            item_row = row.copy()
-            item_row["Description"] = item["Description"]
-            item_row["Unit Price"] = item["Unit Price"]
-            item_row["Quantity"] = item["Quantity"]
-            writer.writerow(item_row)
+    # Write items separately (one row per item), repeating the invoice fields on each row
+    item_columns = ["Description", "Unit Price", "Quantity"]
+    df = pd.DataFrame(data["Items"], columns=item_columns).assign(**row)
+    df.to_csv(output_csv, index=False, columns=list(row.keys()) + item_columns, encoding="utf-8")
 
     print(f"\n✅ Invoice data written to {output_csv}")
 